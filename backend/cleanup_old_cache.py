@@ -1,14 +1,16 @@
 """
 Script to clean up old comparison_cache entries from Supabase.
 Deletes entries older than 1 day.
-This should be run as a scheduled task (cron job).
+Expiration normally runs inside the database via the pg_cron job in
+supabase_schema.sql; this script is a fallback for projects without
+pg_cron and should then be run as a scheduled task (cron job).
 """
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 from dotenv import load_dotenv
 
-from lib.supabase_client import supabase_admin
+from lib.supabase_client import get_admin
 
 # Load .env from project root (parent directory)
 script_dir = Path(__file__).parent
@@ -16,51 +18,50 @@ project_root = script_dir.parent
 env_path = project_root / ".env"
 load_dotenv(dotenv_path=env_path)
 
+# Rows selected and deleted per round trip; the ids travel in the DELETE
+# query string, so batches stay small enough to keep the URL short
+CLEANUP_BATCH_SIZE = 200
+
 
 def cleanup_old_comparison_cache():
     """Delete comparison_cache entries older than 1 day"""
     try:
-        if not supabase_admin:
-            print(
-                "supabase_admin not available, "
-                "skipping comparison_cache cleanup"
-            )
-            return 0
+        supabase_admin = get_admin()
 
         # Get entries older than 1 day
-        cutoff_date = (datetime.now() - timedelta(days=1)).isoformat()
+        cutoff_date = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
 
-        # First, count how many will be deleted
-        count_response = (
-            supabase_admin.table("comparison_cache")
-            .select("session_id", count="exact")
-            .lt("created_at", cutoff_date)
-            .execute()
-        )
+        # Delete in batches ordered by age so each statement stays bounded
+        # on a large backlog and an interrupted run simply resumes next time
+        deleted_count = 0
+        while True:
+            batch = (
+                supabase_admin.table("comparison_cache")
+                .select("session_id")
+                .lt("created_at", cutoff_date)
+                .order("created_at")
+                .limit(CLEANUP_BATCH_SIZE)
+                .execute()
+                .data
+            )
+            if not batch:
+                break
 
-        total_to_delete = (
-            count_response.count if hasattr(count_response, 'count') else 0
-        )
+            delete_response = (
+                supabase_admin.table("comparison_cache")
+                .delete(count="exact")
+                .in_("session_id", [row["session_id"] for row in batch])
+                .execute()
+            )
+            deleted_count += delete_response.count or 0
+
+            if len(batch) < CLEANUP_BATCH_SIZE:
+                break
 
-        if total_to_delete == 0:
+        if deleted_count == 0:
             print("No old comparison_cache entries to delete.")
             return 0
 
-        # Delete entries older than 1 day
-        delete_response = (
-            supabase_admin.table("comparison_cache")
-            .delete()
-            .lt("created_at", cutoff_date)
-            .execute()
-        )
-
-        # Count deleted entries
-        deleted_count = (
-            len(delete_response.data)
-            if delete_response.data
-            else total_to_delete
-        )
-
         print(
             f"Comparison cache cleanup completed. "
             f"Deleted {deleted_count} entries."
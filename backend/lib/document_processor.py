@@ -1,17 +1,126 @@
+import asyncio
+import codecs
+import functools
+import hashlib
 import io
+import threading
 import zipfile
+from collections.abc import Iterator
+from typing import BinaryIO
 from urllib.parse import urlparse
 
-import docx
 import httpx
-import PyPDF2
+import pypdfium2 as pdfium
+from cachetools import TTLCache
 from fastapi import HTTPException, UploadFile
+from lxml import etree
+from pypdf import PdfReader
+
+# Bytes read from an upload to detect its type before parsing it from the stream
+FILE_HEAD_SIZE = 4096
+
+# Leading bytes of the binary formats we accept (DOC is the OLE2 container)
+_MAGIC = {
+    b"%PDF": "pdf",
+    b"PK\x03\x04": "docx",
+    b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1": "doc",
+}
+
+# PDFium is not thread-safe, even across separate documents; parsing runs in
+# worker threads, so calls into it are serialised
+_PDFIUM_LOCK = threading.Lock()
+
+# Leading pages that must contain text before the rest of a PDF is parsed
+PDF_PROBE_PAGES = 2
+
+# WordprocessingML elements that carry paragraph text in word/document.xml
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_P = f"{_W_NS}p"
+_W_T = f"{_W_NS}t"
+_W_TAB = f"{_W_NS}tab"
+_W_BR = f"{_W_NS}br"
+_W_CR = f"{_W_NS}cr"
+
+# Text extracted from uploads, keyed on a digest of the upload, so a retry
+# with the same file skips parsing it again
+_upload_text_cache: TTLCache = TTLCache(maxsize=256, ttl=900)
+UPLOAD_HASH_CHUNK_SIZE = 64 * 1024
+
+# Largest body accepted from a link, read in chunks so oversized responses are aborted early
+MAX_LINK_CONTENT_SIZE = 25 * 1024 * 1024
+LINK_CHUNK_SIZE = 64 * 1024
+
+# Shared client so link fetches reuse pooled connections instead of a new TLS handshake each time
+_http_client = httpx.AsyncClient(
+    timeout=30.0,
+    follow_redirects=True,
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+    http2=True,
+)
+
+
+def _upload_digest(stream: BinaryIO, content_type: str, filename: str) -> str:
+    """BLAKE2b digest of an upload's bytes and declared type, read in chunks.
+
+    The declared type is included because it can decide how the bytes are parsed.
+    The stream is left rewound to its start.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f"{content_type}\0{filename}\0".encode())
+    stream.seek(0)
+    for chunk in iter(functools.partial(stream.read, UPLOAD_HASH_CHUNK_SIZE), b""):
+        hasher.update(chunk)
+    stream.seek(0)
+    return hasher.hexdigest()
+
+
+def _as_stream(content: bytes | BinaryIO) -> BinaryIO:
+    """Return a file-like object positioned at the start of the content."""
+    if isinstance(content, bytes):
+        return io.BytesIO(content)
+    content.seek(0)
+    return content
+
+
+def _is_docx_archive(stream: BinaryIO) -> bool:
+    """Check whether a ZIP archive contains word/document.xml.
+
+    is_zipfile only reads the end-of-central-directory record, and getinfo
+    looks up a single entry instead of building the full namelist().
+    """
+    try:
+        if not zipfile.is_zipfile(stream):
+            return False
+        with zipfile.ZipFile(stream) as zip_file:
+            zip_file.getinfo("word/document.xml")
+        return True
+    except (KeyError, zipfile.BadZipFile, OSError):
+        return False
+
+
+def detect_magic(content: bytes) -> str | None:
+    """Return "pdf", "docx" or "doc" when the content starts with that format's magic bytes."""
+    return _MAGIC.get(content[:4]) or _MAGIC.get(content[:8])
 
 
 def is_valid_file_type(
-    content: bytes, content_type: str = "", filename: str = ""
+    content: bytes,
+    content_type: str = "",
+    filename: str = "",
+    stream: BinaryIO | None = None,
+    magic: str | None = None,
 ) -> bool:
-    """Check if file is PDF, DOC, DOCX, or TXT"""
+    """Check if file is PDF, DOC, DOCX, or TXT
+
+    content may be only the head of the file; pass the full file as stream
+    so ZIP archives can be inspected for DOCX. magic is the result of
+    detect_magic(content) when the caller already has it.
+    """
+    magic = magic or detect_magic(content)
+    # Check by magic bytes (cheap prefix checks first)
+    if magic in ("pdf", "doc"):
+        return True
+
     filename_lower = filename.lower() if filename else ""
 
     # Check by extension
@@ -30,25 +139,15 @@ def is_valid_file_type(
     if content_type.lower() in valid_content_types:
         return True
 
-    # Check by magic bytes
-    # PDF
-    if content.startswith(b"%PDF"):
-        return True
-    # DOCX (ZIP-based)
-    if content.startswith(b"PK\x03\x04"):
+    # DOCX (ZIP-based), only opened when nothing cheaper matched
+    if magic == "docx":
         # DOCX files are ZIP archives, check if it's a DOCX
-        try:
-            zip_file = zipfile.ZipFile(io.BytesIO(content))
-            if "word/document.xml" in zip_file.namelist():
-                return True
-        except Exception:
-            pass
-    # DOC (OLE2 format - starts with specific bytes)
-    if content.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
-        return True
-    # TXT - plain text (check if decodable as UTF-8 or ASCII)
+        # Any other ZIP archive is binary, not text
+        return _is_docx_archive(_as_stream(stream or content))
+    # TXT - plain text (check if the head is decodable as UTF-8 or ASCII)
+    # Incremental decoding tolerates a multi-byte character cut at the end of the head
     try:
-        content.decode("utf-8")
+        codecs.getincrementaldecoder("utf-8")().decode(content[:FILE_HEAD_SIZE])
         return True
     except Exception:
         pass
@@ -57,73 +156,121 @@ def is_valid_file_type(
 
 
 def is_pdf_content(
-    content: bytes, content_type: str = "", filename: str = ""
+    content: bytes, content_type: str = "", filename: str = "", magic: str | None = None
 ) -> bool:
     """Check if content is a PDF based on content type, filename, or magic bytes."""
     return (
         content_type == "application/pdf"
         or filename.lower().endswith(".pdf")
-        or content.startswith(b"%PDF")
+        or (magic or detect_magic(content)) == "pdf"
     )
 
 
 def is_docx_content(
-    content: bytes, content_type: str = "", filename: str = ""
+    content: bytes, content_type: str = "", filename: str = "", magic: str | None = None
 ) -> bool:
     """Check if content is a DOCX based on content type, filename, or magic bytes."""
     return (
         content_type
         == "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
         or filename.lower().endswith(".docx")
-        or content.startswith(b"PK\x03\x04")
+        or (magic or detect_magic(content)) == "docx"
     )
 
 
 def is_doc_content(
-    content: bytes, content_type: str = "", filename: str = ""
+    content: bytes, content_type: str = "", filename: str = "", magic: str | None = None
 ) -> bool:
     """Check if content is a DOC (old format) based on content type, filename, or magic bytes."""
     return (
         content_type == "application/msword"
         or filename.lower().endswith(".doc")
-        or content.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1")  # OLE2 magic bytes
+        or (magic or detect_magic(content)) == "doc"
     )
 
 
 def is_txt_content(
-    content: bytes, content_type: str = "", filename: str = ""
+    content: bytes, content_type: str = "", filename: str = "", magic: str | None = None
 ) -> bool:
     """Check if content is a text file."""
     filename_lower = filename.lower() if filename else ""
+    if filename_lower.endswith(".txt") or content_type.startswith("text/plain"):
+        return True
+    # Try to decode as text (simple heuristic)
+    magic = magic or detect_magic(content)
     return (
-        filename_lower.endswith(".txt")
-        or content_type.startswith("text/plain")
-        # Try to decode as text (simple heuristic)
-        or (
-            not is_pdf_content(content, content_type, filename)
-            and not is_docx_content(content, content_type, filename)
-            and not is_doc_content(content, content_type, filename)
-        )
+        not is_pdf_content(content, content_type, filename, magic)
+        and not is_docx_content(content, content_type, filename, magic)
+        and not is_doc_content(content, content_type, filename, magic)
     )
 
 
-def extract_text_from_pdf(pdf_content: bytes) -> str:
-    """Extract text from PDF content."""
+def _iter_pdfium_page_text(pdf: pdfium.PdfDocument):
+    """Yield the text of each PDF page, releasing pdfium handles as it goes."""
+    for page in pdf:
+        textpage = page.get_textpage()
+        try:
+            yield textpage.get_text_range().replace("\r\n", "\n")
+        finally:
+            textpage.close()
+            page.close()
+
+
+def _iter_pypdf_page_text(pdf_reader: PdfReader):
+    """Yield the text of each PDF page, skipping pages that fail to parse."""
+    for page_num, page in enumerate(pdf_reader.pages):
+        try:
+            yield page.extract_text()
+        except Exception as e:
+            print(f"Error extracting text from PDF page {page_num}: {str(e)}")
+
+
+def _join_page_text(page_texts: Iterator[str]) -> str:
+    """Join the text of PDF pages, giving up early when the first pages have none.
+
+    Scanned (image-only) PDFs have no text layer on any page, so the
+    remaining pages are not parsed once the probe pages come back empty.
+    """
+    pages = []
+    for page_num, page_text in enumerate(page_texts):
+        if page_text:
+            pages.append(page_text)
+        if page_num == PDF_PROBE_PAGES - 1 and not any(text.strip() for text in pages):
+            return ""
+    return "\n\n".join(pages)
+
+
+def _extract_pdf_text_pdfium(pdf_content: bytes | BinaryIO) -> str:
+    """Extract PDF text with pdfium (native parser)."""
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(
+            pdf_content if isinstance(pdf_content, bytes) else _as_stream(pdf_content)
+        )
+        try:
+            return _join_page_text(_iter_pdfium_page_text(pdf))
+        finally:
+            pdf.close()
+
+
+def _extract_pdf_text_pypdf(pdf_content: bytes | BinaryIO) -> str:
+    """Extract PDF text with pypdf (pure Python parser)."""
+    pdf_reader = PdfReader(_as_stream(pdf_content))
+    return _join_page_text(_iter_pypdf_page_text(pdf_reader))
+
+
+def extract_text_from_pdf(pdf_content: bytes | BinaryIO) -> str:
+    """Extract text from PDF content (bytes or a file-like object).
+
+    Uses pdfium and falls back to pypdf for the rare files pdfium rejects.
+    """
     try:
-        pdf_file = io.BytesIO(pdf_content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text_parts = []
-
-        for page_num, page in enumerate(pdf_reader.pages):
-            try:
-                page_text = page.extract_text()
-                if page_text:
-                    text_parts.append(page_text)
-            except Exception as e:
-                print(f"Error extracting text from PDF page {page_num}: {str(e)}")
-                continue
-
-        if not text_parts:
+        try:
+            text = _extract_pdf_text_pdfium(pdf_content)
+        except pdfium.PdfiumError as e:
+            print(f"pdfium could not read PDF, falling back to pypdf: {str(e)}")
+            text = _extract_pdf_text_pypdf(pdf_content)
+
+        if not text:
             raise HTTPException(
                 status_code=400,
                 detail=(
@@ -131,7 +278,7 @@ def extract_text_from_pdf(pdf_content: bytes) -> str:
                     "The PDF might be image-based or encrypted."
                 ),
             )
-        return "\n\n".join(text_parts)
+        return text
     except HTTPException:
         raise
     except Exception as e:
@@ -140,15 +287,34 @@ def extract_text_from_pdf(pdf_content: bytes) -> str:
         )
 
 
-def extract_text_from_docx(docx_content: bytes) -> str:
-    """Extract text from DOCX content."""
+def extract_text_from_docx(docx_content: bytes | BinaryIO) -> str:
+    """Extract text from DOCX content (bytes or a file-like object)."""
     try:
-        docx_file = io.BytesIO(docx_content)
-        docx_reader = docx.Document(docx_file)
-        text_parts = []
-        for paragraph in docx_reader.paragraphs:
-            text_parts.append(paragraph.text)
-        return "\n\n".join(text_parts)
+        with (
+            zipfile.ZipFile(_as_stream(docx_content)) as docx_zip,
+            docx_zip.open("word/document.xml") as document_xml,
+        ):
+            paragraphs = []
+            runs = []
+            # Stream the XML instead of building a document object model;
+            # each paragraph is cleared once its text has been collected
+            for _, element in etree.iterparse(
+                document_xml, tag=(_W_P, _W_T, _W_TAB, _W_BR, _W_CR)
+            ):
+                if element.tag == _W_T:
+                    runs.append(element.text or "")
+                elif element.tag == _W_TAB:
+                    runs.append("\t")
+                elif element.tag == _W_CR or (
+                    element.tag == _W_BR
+                    and element.get(f"{_W_NS}type", "textWrapping") == "textWrapping"
+                ):
+                    runs.append("\n")
+                elif element.tag == _W_P:
+                    paragraphs.append("".join(runs))
+                    runs = []
+                    element.clear()
+        return "\n\n".join(paragraphs)
     except Exception as e:
         raise HTTPException(
             status_code=400, detail=f"Error reading DOCX: {str(e)}"
@@ -184,64 +350,107 @@ def decode_text_content(content: bytes) -> str:
             )
 
 
+async def close_http_client() -> None:
+    """Close the shared HTTP client used to fetch links."""
+    await _http_client.aclose()
+
+
 async def fetch_content_from_link(link: str) -> tuple[bytes, str]:
     """Fetch content from a URL and return content bytes and content type."""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(link, timeout=30.0, follow_redirects=True)
+    too_large = HTTPException(
+        status_code=413,
+        detail=(
+            "The linked file is too large. "
+            f"Maximum size is {MAX_LINK_CONTENT_SIZE // (1024 * 1024)} MB."
+        ),
+    )
+    try:
+        async with _http_client.stream("GET", link) as response:
             response.raise_for_status()
             content_type = response.headers.get("content-type", "").lower()
-            return response.content, content_type
-        except httpx.HTTPStatusError as e:
-            raise HTTPException(
-                status_code=400,
-                detail=(
-                    f"Error fetching link (HTTP {e.response.status_code}): "
-                    f"{str(e)}"
-                ),
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=400, detail=f"Error fetching link: {str(e)}"
-            )
+
+            content_length = response.headers.get("content-length", "")
+            if content_length.isdigit() and int(content_length) > MAX_LINK_CONTENT_SIZE:
+                raise too_large
+
+            content = bytearray()
+            async for chunk in response.aiter_bytes(LINK_CHUNK_SIZE):
+                content.extend(chunk)
+                if len(content) > MAX_LINK_CONTENT_SIZE:
+                    raise too_large
+
+            return bytes(content), content_type
+    except HTTPException:
+        raise
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Error fetching link (HTTP {e.response.status_code}): "
+                f"{str(e)}"
+            ),
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=400, detail=f"Error fetching link: {str(e)}"
+        )
+
+
+async def _extract_text_from_upload(file: UploadFile, file_type: str, file_name: str) -> str:
+    """Extract text from an uploaded file, validating its type first."""
+    # Only the head is read into memory; PDF/DOCX parsers read the spooled upload directly
+    head = await file.read(FILE_HEAD_SIZE)
+    magic = detect_magic(head)
+
+    # Validate file type first
+    if not is_valid_file_type(head, file_type, file_name, stream=file.file, magic=magic):
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Tipo de archivo no soportado. Solo se aceptan archivos "
+                f"PDF, DOC, DOCX o TXT. Archivo recibido: {file_name}"
+            ),
+        )
+
+    if is_pdf_content(head, file_type, file_name, magic):
+        return await asyncio.to_thread(extract_text_from_pdf, file.file)
+    elif is_docx_content(head, file_type, file_name, magic):
+        return await asyncio.to_thread(extract_text_from_docx, file.file)
+    elif is_doc_content(head, file_type, file_name, magic):
+        return extract_text_from_doc(head)
+    else:
+        # Assume it's a text file
+        await file.seek(0)
+        return decode_text_content(await file.read())
 
 
 async def extract_text_from_input(
     file: UploadFile | None, link: str | None
 ) -> str:
-    """Extract text from file or link. Supports PDF, DOC, DOCX, and TXT files only."""
+    """Extract text from file or link. Supports PDF, DOC, DOCX, and TXT files only.
+
+    PDF and DOCX parsing runs in a worker thread so concurrent extractions
+    don't block the event loop. Text from an upload is cached for a while,
+    keyed on its bytes, so retries with the same file are not parsed again.
+    """
     if file:
-        content = await file.read()
         file_type = file.content_type or ""
         file_name = file.filename or ""
-
-        # Validate file type first
-        if not is_valid_file_type(content, file_type, file_name):
-            raise HTTPException(
-                status_code=400,
-                detail=(
-                    f"Tipo de archivo no soportado. Solo se aceptan archivos "
-                    f"PDF, DOC, DOCX o TXT. Archivo recibido: {file_name}"
-                ),
-            )
-
-        if is_pdf_content(content, file_type, file_name):
-            return extract_text_from_pdf(content)
-        elif is_docx_content(content, file_type, file_name):
-            return extract_text_from_docx(content)
-        elif is_doc_content(content, file_type, file_name):
-            return extract_text_from_doc(content)
-        else:
-            # Assume it's a text file
-            return decode_text_content(content)
+        cache_key = await asyncio.to_thread(_upload_digest, file.file, file_type, file_name)
+        text = _upload_text_cache.get(cache_key)
+        if text is None:
+            text = await _extract_text_from_upload(file, file_type, file_name)
+            _upload_text_cache[cache_key] = text
+        return text
 
     elif link:
         content, content_type = await fetch_content_from_link(link)
         parsed_url = urlparse(link)
         filename = parsed_url.path.split("/")[-1] if parsed_url.path else ""
+        magic = detect_magic(content)
 
         # Validate file type first
-        if not is_valid_file_type(content, content_type, filename):
+        if not is_valid_file_type(content, content_type, filename, magic=magic):
             raise HTTPException(
                 status_code=400,
                 detail=(
@@ -250,11 +459,11 @@ async def extract_text_from_input(
                 ),
             )
 
-        if is_pdf_content(content, content_type, parsed_url.path):
-            return extract_text_from_pdf(content)
-        elif is_docx_content(content, content_type, parsed_url.path):
-            return extract_text_from_docx(content)
-        elif is_doc_content(content, content_type, parsed_url.path):
+        if is_pdf_content(content, content_type, parsed_url.path, magic):
+            return await asyncio.to_thread(extract_text_from_pdf, content)
+        elif is_docx_content(content, content_type, parsed_url.path, magic):
+            return await asyncio.to_thread(extract_text_from_docx, content)
+        elif is_doc_content(content, content_type, parsed_url.path, magic):
             return extract_text_from_doc(content)
         else:
             return decode_text_content(content)
@@ -1,8 +1,15 @@
+import asyncio
+import functools
+import hashlib
+import json
 import os
+import re
 from typing import Optional
+
 import google.generativeai as genai
-import json
-import re
+from cachetools import TTLCache
+from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 
 api_key = os.getenv("GEMINI_API_KEY")
 if not api_key:
@@ -15,10 +22,91 @@ genai.configure(api_key=api_key)
 # You can set GEMINI_MODEL environment variable to override
 MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
 
+# Seconds to wait for Gemini before sending a duplicate (hedged) request.
+# Hedging doubles the quota spent on slow calls, so it is off unless GEMINI_HEDGE_AFTER is set
+HEDGE_AFTER_SECONDS = float(os.getenv("GEMINI_HEDGE_AFTER", "0"))
+
+
+# In-process cache of Gemini results keyed on a hash of the prompt inputs,
+# so re-submitted CVs and offers skip the multi-second LLM round trip
+_analysis_cache: TTLCache = TTLCache(maxsize=512, ttl=86400)
+
+
+def _cache_key(kind: str, *texts: str | None) -> str:
+    """Build a cache key from the analysis kind and a BLAKE2b digest of its inputs"""
+    hasher = hashlib.blake2b(digest_size=16)
+    for text in texts:
+        hasher.update((text or "").encode("utf-8"))
+        hasher.update(b"\0")
+    return f"{kind}:{hasher.hexdigest()}"
+
+
+# Structured output schema for compare_cv_and_offer, so Gemini returns bare JSON
+COMPARISON_GENERATION_CONFIG = genai.GenerationConfig(
+    response_mime_type="application/json",
+    response_schema={
+        "type": "object",
+        "properties": {
+            "strengths": {"type": "array", "items": {"type": "string"}},
+            "weaknesses": {"type": "array", "items": {"type": "string"}},
+            "recommendation": {"type": "string"},
+            "matchPercentage": {"type": "integer"},
+            "fourWeekPlan": {"type": "string"},
+        },
+        "required": ["strengths", "weaknesses", "recommendation", "matchPercentage", "fourWeekPlan"],
+    },
+)
+
+
+# Section headers and bullet lines recognised by parse_fallback_response
+SECTION_RE = re.compile(
+    r"(?P<strengths>puntos fuertes|strengths)"
+    r"|(?P<weaknesses>puntos débiles|weaknesses)"
+    r"|(?P<recommendation>recomendación|recommendation)"
+    r"|(?P<plan>plan|4 semanas)",
+    re.IGNORECASE
+)
+BULLET_RE = re.compile(r"^\s*[-•*](.*)")
+
+
+@functools.lru_cache(maxsize=4)
+def _get_model(name: str = MODEL_NAME) -> genai.GenerativeModel:
+    """Return a shared GenerativeModel; it holds no per-request state"""
+    return genai.GenerativeModel(name)
+
+
+@retry(
+    wait=wait_exponential(multiplier=0.5, max=4),
+    stop=stop_after_attempt(3),
+    retry=retry_if_exception_type((ServiceUnavailable, ResourceExhausted)),
+    reraise=True,
+)
+async def _generate(model: genai.GenerativeModel, prompt: str, **kwargs):
+    """Call Gemini, retrying transient 503/429 errors with exponential backoff"""
+    if HEDGE_AFTER_SECONDS <= 0:
+        return await model.generate_content_async(prompt, **kwargs)
+
+    # Hedged request: if the first call is slow, race a second one and keep the winner
+    tasks = {asyncio.create_task(model.generate_content_async(prompt, **kwargs))}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=HEDGE_AFTER_SECONDS)
+        if not done:
+            tasks.add(asyncio.create_task(model.generate_content_async(prompt, **kwargs)))
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        return done.pop().result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
 
 async def analyze_cv(cv_text: str) -> str:
     """Analyze CV and extract key information"""
-    model = genai.GenerativeModel(MODEL_NAME)
+    cache_key = _cache_key("cv", cv_text)
+    cached = _analysis_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    model = _get_model()
 
     prompt = f"""Analyze the following CV and extract key information about:
 - Work experience
@@ -32,13 +120,19 @@ CV:
 
 Provide a structured analysis of the CV."""
 
-    response = model.generate_content(prompt)
+    response = await _generate(model, prompt)
+    _analysis_cache[cache_key] = response.text
     return response.text
 
 
 async def analyze_job_offer(job_offer_text: str) -> str:
     """Analyze job offer and extract key information"""
-    model = genai.GenerativeModel(MODEL_NAME)
+    cache_key = _cache_key("job_offer", job_offer_text)
+    cached = _analysis_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    model = _get_model()
 
     prompt = f"""Analyze the following job offer and extract key information about:
 - Technical requirements
@@ -52,7 +146,8 @@ Job offer:
 
 Provide a structured analysis of the offer."""
 
-    response = model.generate_content(prompt)
+    response = await _generate(model, prompt)
+    _analysis_cache[cache_key] = response.text
     return response.text
 
 
@@ -62,7 +157,12 @@ async def compare_cv_and_offer(
     additional_considerations: Optional[str] = None
 ) -> dict:
     """Compare CV and job offer to generate analysis"""
-    model = genai.GenerativeModel(MODEL_NAME)
+    cache_key = _cache_key("compare", cv_analysis, job_offer_analysis, additional_considerations)
+    cached = _analysis_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    model = _get_model()
 
     considerations_text = f"\nAdditional user considerations that must always be related to the job offer: {additional_considerations}" if additional_considerations else ""
 
@@ -89,23 +189,26 @@ Respond ONLY in valid JSON format with this exact structure (no additional text
   "fourWeekPlan": "Detailed 4-week plan with clear format, each week on a separate line"
 }}"""
 
-    response = model.generate_content(prompt)
+    response = await _generate(
+        model, prompt, generation_config=COMPARISON_GENERATION_CONFIG
+    )
     text = response.text
 
-    # Try to extract JSON from the response
-    json_match = re.search(r'\{[\s\S]*\}', text)
-    if json_match:
-        try:
-            result = json.loads(json_match.group(0))
-            return {
-                "strengths": result.get("strengths", []),
-                "weaknesses": result.get("weaknesses", []),
-                "recommendation": result.get("recommendation", ""),
-                "matchPercentage": result.get("matchPercentage", 50),
-                "fourWeekPlan": result.get("fourWeekPlan", "")
-            }
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON: {e}")
+    # The response is constrained to JSON; only a truncated answer fails to parse
+    try:
+        result = json.loads(text)
+        comparison = {
+            "strengths": result.get("strengths", []),
+            "weaknesses": result.get("weaknesses", []),
+            "recommendation": result.get("recommendation", ""),
+            "matchPercentage": result.get("matchPercentage", 50),
+            "fourWeekPlan": result.get("fourWeekPlan", "")
+        }
+        # Fallback-parsed responses are not cached so a retry can get valid JSON
+        _analysis_cache[cache_key] = comparison
+        return comparison
+    except json.JSONDecodeError as e:
+        print(f"Error parsing JSON: {e}")
 
     # Fallback parsing
     return parse_fallback_response(text)
@@ -119,29 +222,29 @@ def parse_fallback_response(text: str) -> dict:
     match_percentage = 50
     four_week_plan = ""
 
-    lines = text.split('\n')
     current_section = ""
 
-    for line in lines:
-        line_lower = line.lower()
-        if 'puntos fuertes' in line_lower or 'strengths' in line_lower:
-            current_section = 'strengths'
-        elif 'puntos débiles' in line_lower or 'weaknesses' in line_lower:
-            current_section = 'weaknesses'
-        elif 'recomendación' in line_lower or 'recommendation' in line_lower:
-            current_section = 'recommendation'
-        elif 'plan' in line_lower or '4 semanas' in line_lower:
-            current_section = 'plan'
-        elif line.strip().startswith(('-', '•', '*')):
-            item = line.strip()[1:].strip()
+    for line in text.splitlines():
+        section_match = SECTION_RE.search(line)
+        if section_match:
+            # Group names match the section names
+            current_section = section_match.lastgroup
+            continue
+
+        bullet_match = BULLET_RE.match(line)
+        if bullet_match:
+            item = bullet_match.group(1).strip()
             if current_section == 'strengths':
                 strengths.append(item)
             elif current_section == 'weaknesses':
                 weaknesses.append(item)
-        elif current_section == 'recommendation' and line.strip():
-            recommendation += line.strip() + ' '
-        elif current_section == 'plan' and line.strip():
-            four_week_plan += line.strip() + '\n'
+            continue
+
+        line = line.strip()
+        if current_section == 'recommendation' and line:
+            recommendation += line + ' '
+        elif current_section == 'plan' and line:
+            four_week_plan += line + '\n'
 
     total_points = len(strengths) + len(weaknesses)
     if total_points > 0:
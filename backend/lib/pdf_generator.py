@@ -1,12 +1,212 @@
+import asyncio
+import functools
 import io
+import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
 
-from reportlab.lib.colors import HexColor
+from reportlab.lib.colors import Color, HexColor
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
 from reportlab.lib.units import inch
-from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer
+from reportlab.lib.utils import simpleSplit
+from reportlab.platypus import Flowable, PageBreak, Paragraph, Preformatted, SimpleDocTemplate, Spacer
+
+# ReportLab layout is CPU-bound, so PDFs are built in worker threads
+_PDF_POOL = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="pdf")
+
+# Colors used by the styles below and for the match percentage
+_PRIMARY = HexColor('#1e40af')
+_GREEN = HexColor('#10b981')
+_AMBER = HexColor('#f59e0b')
+_RED = HexColor('#ef4444')
+
+# Match colors indexed by (match >= 50) + (match >= 70)
+_MATCH_COLORS = (_RED, _AMBER, _GREEN)
+
+# Top and bottom page margin
+_PAGE_MARGIN = 0.5*inch
+
+# Spacer heights. Spacers themselves are created per PDF: frames set and
+# delete attributes on each flowable while laying it out, so sharing one
+# instance across concurrent builds in _PDF_POOL would race
+_SPACE_LARGE = 0.3*inch
+_SPACE_MEDIUM = 0.2*inch
+_SPACE_SMALL = 0.15*inch
+
+# Prefix for each item in a bullet block
+_BULLET_PREFIX = "• "
+
+# Lines of each detailed analysis included in the PDF
+_ANALYSIS_MAX_LINES = 20
+
+# Usable text width: A4 minus the default 1 inch side margins and 6pt frame padding
+_TEXT_WIDTH = A4[0] - 2*inch - 12
+
+# Paragraph styles are immutable once built, so they are shared by every PDF
+_STYLES = getSampleStyleSheet()
+
+_TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_STYLES['Heading1'],
+    fontSize=24,
+    textColor=_PRIMARY,
+    spaceAfter=30,
+    alignment=TA_CENTER
+)
+
+_HEADING_STYLE = ParagraphStyle(
+    'CustomHeading',
+    parent=_STYLES['Heading2'],
+    fontSize=16,
+    textColor=_PRIMARY,
+    spaceAfter=12,
+    spaceBefore=12
+)
+
+_BODY_STYLE = ParagraphStyle(
+    'CustomBody',
+    parent=_STYLES['BodyText'],
+    fontSize=11,
+    alignment=TA_JUSTIFY,
+    spaceAfter=10
+)
+
+_WEEK_HEADING_STYLE = ParagraphStyle(
+    'WeekHeading',
+    parent=_STYLES['Heading3'],
+    fontSize=13,
+    textColor=_PRIMARY,
+    spaceAfter=8,
+    spaceBefore=16,
+    leftIndent=0
+)
+
+_BULLET_STYLE = ParagraphStyle(
+    'BulletStyle',
+    parent=_STYLES['BodyText'],
+    fontSize=10,
+    alignment=TA_LEFT,
+    spaceAfter=6,
+    leftIndent=20,
+    bulletIndent=10
+)
+
+
+# Patterns used to lay out the 4-week plan, compiled once at import
+_WEEK_PATTERN = re.compile(
+    r'(Semana\s*\d+|Week\s*\d+)\s*:\s*([\s\S]*?)(?=(?:Semana\s*\d+|Week\s*\d+)\s*:|$)',
+    re.IGNORECASE | re.DOTALL
+)
+_TITLE_RE = re.compile(r'^([^\.]+?)(?:\.|Objetivos:|Acciones:|Actions|Goals:)', re.IGNORECASE)
+# _TITLE_RE's markers for the str.find fast path, plus the characters that
+# IGNORECASE matches to their letters but str.lower() does not map to them
+_TITLE_MARKERS = ('objetivos:', 'acciones:', 'actions', 'goals:')
+_CASE_FOLD_EXCEPTIONS = ('İ', 'ı', 'ſ')
+# Classifies every non-blank plan line in one finditer pass; leading
+# whitespace (and blank lines) are consumed by the ^\s* prefix
+_PLAN_LINE_RE = re.compile(
+    r'^\s*(?:[-•*](?P<bullet>.*)'
+    r'|(?P<section>(?:Objetivos|Acciones|Actions|Goals):.*)'
+    r'|(?P<para>\S.*))',
+    re.IGNORECASE | re.MULTILINE
+)
+
+
+@functools.lru_cache(maxsize=3)
+def _match_style(color: Color) -> ParagraphStyle:
+    """Style for the match percentage line, built once per color"""
+    return ParagraphStyle(
+        'MatchStyle',
+        parent=_STYLES['Heading2'],
+        fontSize=18,
+        textColor=color,
+        alignment=TA_CENTER,
+        spaceAfter=20
+    )
+
+
+def _bullet_markup(items: list[str]) -> str:
+    """Render bullet items as one block of paragraph markup joined by line breaks"""
+    return "<br/>".join(_BULLET_PREFIX + escape(item) for item in items)
+
+
+def _split_week_title(week_content: str) -> tuple[str, str]:
+    """Split a week's text into its title and the content after it
+
+    week_content must already be stripped, so the title only needs its
+    trailing whitespace removed and the content only its leading whitespace.
+    """
+    # Common case: a plain sentence ending in a period, with no marker before it
+    first_period = week_content.find('.')
+    if first_period > 0:
+        head = week_content[:first_period]
+        lowered = head.lower()
+        if not any(lowered.find(marker, 1) != -1 for marker in _TITLE_MARKERS) and not any(
+            char in head for char in _CASE_FOLD_EXCEPTIONS
+        ):
+            return head.rstrip(), week_content[first_period + 1:].lstrip()
+
+    title_match = _TITLE_RE.match(week_content)
+    if title_match:
+        return title_match.group(1).rstrip(), week_content[title_match.end():].lstrip()
+
+    # Fallback: use first sentence as title
+    if first_period != -1:
+        return week_content[:first_period].rstrip(), week_content[first_period + 1:].lstrip()
+    first_line, _, rest = week_content.partition('\n')
+    return first_line.rstrip(), rest.lstrip()
+
+
+def _append_plan_lines(
+    items: list[tuple[ParagraphStyle | Flowable, str | None]],
+    text: str,
+    bold_sections: bool = True
+) -> None:
+    """Append plan lines to items, grouping consecutive bullets into one block"""
+    bullets = []
+    for match in _PLAN_LINE_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == 'bullet':
+            bullets.append(match.group('bullet').strip())
+            continue
+
+        if bullets:
+            items.append((_BULLET_STYLE, _bullet_markup(bullets)))
+            bullets = []
+
+        line = match.group(kind).rstrip()
+        if kind == 'section' and bold_sections:
+            line = "<b>" + line + "</b>"
+        items.append((_BODY_STYLE, line))
+
+    if bullets:
+        items.append((_BULLET_STYLE, _bullet_markup(bullets)))
+
+
+def _append_analysis_lines(
+    items: list[tuple[ParagraphStyle | Flowable, str | None]],
+    text: str
+) -> None:
+    """Append the first lines of an analysis as body paragraphs (limit length)
+
+    Walks the text with str.find and stops at the limit, so the rest of a
+    long analysis is never split or copied. Analyses are plain text, so each
+    line is wrapped to the page width up front and rendered as Preformatted,
+    which skips the Paragraph markup parser.
+    """
+    start = 0
+    for _ in range(_ANALYSIS_MAX_LINES):
+        end = text.find('\n', start)
+        line = text[start:end if end != -1 else None].strip()
+        if line:
+            wrapped = simpleSplit(line, _BODY_STYLE.fontName, _BODY_STYLE.fontSize, _TEXT_WIDTH)
+            items.append((Preformatted('\n'.join(wrapped), _BODY_STYLE), None))
+        if end == -1:
+            break
+        start = end + 1
 
 
 def generate_pdf(
@@ -21,106 +221,47 @@ def generate_pdf(
 ) -> io.BytesIO:
     """Generate PDF with all analysis results"""
     buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
-
-    story = []
-    styles = getSampleStyleSheet()
-
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=HexColor('#1e40af'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=_PAGE_MARGIN, bottomMargin=_PAGE_MARGIN)
 
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=16,
-        textColor=HexColor('#1e40af'),
-        spaceAfter=12,
-        spaceBefore=12
-    )
-
-    body_style = ParagraphStyle(
-        'CustomBody',
-        parent=styles['BodyText'],
-        fontSize=11,
-        alignment=TA_JUSTIFY,
-        spaceAfter=10
-    )
-
-    week_heading_style = ParagraphStyle(
-        'WeekHeading',
-        parent=styles['Heading3'],
-        fontSize=13,
-        textColor=HexColor('#1e40af'),
-        spaceAfter=8,
-        spaceBefore=16,
-        leftIndent=0
-    )
-
-    bullet_style = ParagraphStyle(
-        'BulletStyle',
-        parent=styles['BodyText'],
-        fontSize=10,
-        alignment=TA_LEFT,
-        spaceAfter=6,
-        leftIndent=20,
-        bulletIndent=10
-    )
+    # (style, markup) pairs for paragraphs and (flowable, None) for spacing;
+    # Paragraphs are built in one pass once the whole layout is known
+    items: list[tuple[ParagraphStyle | Flowable, str | None]] = []
 
     # Title
-    story.append(Paragraph("Application Analysis", title_style))
-    story.append(Spacer(1, 0.3*inch))
+    items.append((_TITLE_STYLE, "Application Analysis"))
+    items.append((Spacer(1, _SPACE_LARGE), None))
 
     # Match Percentage
-    match_color = HexColor('#10b981') if match_percentage >= 70 else HexColor('#f59e0b') if match_percentage >= 50 else HexColor('#ef4444')
-    match_style = ParagraphStyle(
-        'MatchStyle',
-        parent=styles['Heading2'],
-        fontSize=18,
-        textColor=match_color,
-        alignment=TA_CENTER,
-        spaceAfter=20
-    )
-    story.append(Paragraph(f"Match: {match_percentage}%", match_style))
-    story.append(Spacer(1, 0.2*inch))
+    match_color = _MATCH_COLORS[(match_percentage >= 50) + (match_percentage >= 70)]
+    items.append((_match_style(match_color), f"Match: {match_percentage}%"))
+    items.append((Spacer(1, _SPACE_MEDIUM), None))
 
     # Recommendation
-    story.append(Paragraph("Recommendation", heading_style))
-    story.append(Paragraph(recommendation, body_style))
-    story.append(Spacer(1, 0.2*inch))
+    items.append((_HEADING_STYLE, "Recommendation"))
+    items.append((_BODY_STYLE, recommendation))
+    items.append((Spacer(1, _SPACE_MEDIUM), None))
 
     # Strengths
-    story.append(Paragraph("Strengths", heading_style))
-    for strength in strengths:
-        story.append(Paragraph(f"• {strength}", body_style))
-    story.append(Spacer(1, 0.2*inch))
+    items.append((_HEADING_STYLE, "Strengths"))
+    if strengths:
+        items.append((_BODY_STYLE, _bullet_markup(strengths)))
+    items.append((Spacer(1, _SPACE_MEDIUM), None))
 
     # Weaknesses
-    story.append(Paragraph("Weaknesses", heading_style))
-    for weakness in weaknesses:
-        story.append(Paragraph(f"• {weakness}", body_style))
-    story.append(PageBreak())
+    items.append((_HEADING_STYLE, "Weaknesses"))
+    if weaknesses:
+        items.append((_BODY_STYLE, _bullet_markup(weaknesses)))
+    items.append((PageBreak(), None))
 
     # Four Week Plan
-    story.append(Paragraph("4-Week Plan", heading_style))
+    items.append((_HEADING_STYLE, "4-Week Plan"))
 
     # Parse and format the 4-week plan
     plan_text = four_week_plan.strip()
 
     # Try to detect weeks using regex (handles both "Semana X" and "Week X")
-    week_pattern = re.compile(
-        r'(Semana\s*\d+|Week\s*\d+)\s*:\s*([\s\S]*?)(?=(?:Semana\s*\d+|Week\s*\d+)\s*:|$)',
-        re.IGNORECASE | re.DOTALL
-    )
-
     weeks = []
-    for match in week_pattern.finditer(plan_text):
+    for match in _WEEK_PATTERN.finditer(plan_text):
         week_number = match.group(1)
         week_content = match.group(2).strip()
         weeks.append((week_number, week_content))
@@ -129,89 +270,68 @@ def generate_pdf(
         # Format each week with proper spacing
         for week_num, week_content in weeks:
             # Extract title (everything until first period or "Objetivos:")
-            title_match = re.match(r'^([^\.]+?)(?:\.|Objetivos:|Acciones:|Actions|Goals:)', week_content, re.IGNORECASE)
-            if title_match:
-                title = title_match.group(1).strip()
-                content = week_content[len(title_match.group(0)):].strip()
-            else:
-                # Fallback: use first sentence as title
-                first_period = week_content.find('.')
-                if first_period != -1:
-                    title = week_content[:first_period].strip()
-                    content = week_content[first_period + 1:].strip()
-                else:
-                    title = week_content.split('\n')[0].strip()
-                    content = '\n'.join(week_content.split('\n')[1:]).strip()
+            title, content = _split_week_title(week_content)
 
             # Add week heading
-            story.append(Paragraph(f"{week_num}: {title}", week_heading_style))
-
-            # Process content line by line
-            if content:
-                for line in content.split('\n'):
-                    line = line.strip()
-                    if not line:
-                        continue
-
-                    # Check if it's a bullet point
-                    if line.startswith(('-', '•', '*')):
-                        bullet_text = line[1:].strip()
-                        story.append(Paragraph(f"• {bullet_text}", bullet_style))
-                    # Check if it's a section header
-                    elif re.match(r'^(Objetivos|Acciones|Actions|Goals):', line, re.IGNORECASE):
-                        story.append(Paragraph(f"<b>{line}</b>", body_style))
-                    else:
-                        story.append(Paragraph(line, body_style))
-
-            story.append(Spacer(1, 0.15*inch))
+            items.append((_WEEK_HEADING_STYLE, week_num + ": " + title))
+
+            # Process content line by line, grouping consecutive bullets
+            _append_plan_lines(items, content)
+
+            items.append((Spacer(1, _SPACE_SMALL), None))
     else:
-        # Fallback: if no weeks detected, format line by line
-        for line in plan_text.split('\n'):
-            line = line.strip()
-            if not line:
-                continue
-
-            # Check for week headers
-            week_header_match = re.match(r'^(semana\s*\d+|week\s*\d+)\s*:\s*(.+)$', line, re.IGNORECASE)
-            if week_header_match:
-                week_num = week_header_match.group(1)
-                week_title = week_header_match.group(2)
-                # Extract title from week_title
-                first_period = week_title.find('.')
-                if first_period != -1:
-                    title = week_title[:first_period].strip()
-                else:
-                    title = week_title.strip()
-                story.append(Paragraph(f"{week_num}: {title}", week_heading_style))
-            elif line.startswith(('-', '•', '*')):
-                bullet_text = line[1:].strip()
-                story.append(Paragraph(f"• {bullet_text}", bullet_style))
-            else:
-                story.append(Paragraph(line, body_style))
-
-    story.append(Spacer(1, 0.2*inch))
+        # Fallback: if no weeks detected, format line by line, grouping consecutive bullets
+        _append_plan_lines(items, plan_text, bold_sections=False)
+
+    items.append((Spacer(1, _SPACE_MEDIUM), None))
 
     # Additional Considerations
     if additional_considerations:
-        story.append(Paragraph("Additional Considerations", heading_style))
-        story.append(Paragraph(additional_considerations, body_style))
-        story.append(Spacer(1, 0.2*inch))
+        items.append((_HEADING_STYLE, "Additional Considerations"))
+        items.append((_BODY_STYLE, additional_considerations))
+        items.append((Spacer(1, _SPACE_MEDIUM), None))
 
     # Analysis Details
-    story.append(PageBreak())
-    story.append(Paragraph("Detailed CV Analysis", heading_style))
-    cv_paragraphs = cv_analysis.split('\n')
-    for para in cv_paragraphs[:20]:  # Limit length
-        if para.strip():
-            story.append(Paragraph(para.strip(), body_style))
-
-    story.append(Spacer(1, 0.2*inch))
-    story.append(Paragraph("Detailed Job Offer Analysis", heading_style))
-    offer_paragraphs = job_offer_analysis.split('\n')
-    for para in offer_paragraphs[:20]:  # Limit length
-        if para.strip():
-            story.append(Paragraph(para.strip(), body_style))
+    items.append((PageBreak(), None))
+    items.append((_HEADING_STYLE, "Detailed CV Analysis"))
+    _append_analysis_lines(items, cv_analysis)
+
+    items.append((Spacer(1, _SPACE_MEDIUM), None))
+    items.append((_HEADING_STYLE, "Detailed Job Offer Analysis"))
+    _append_analysis_lines(items, job_offer_analysis)
 
+    story = [
+        Paragraph(text, style) if text is not None else style
+        for style, text in items
+    ]
     doc.build(story)
     buffer.seek(0)
     return buffer
+
+
+async def generate_pdf_async(
+    cv_analysis: str,
+    job_offer_analysis: str,
+    strengths: list[str],
+    weaknesses: list[str],
+    recommendation: str,
+    match_percentage: int,
+    four_week_plan: str,
+    additional_considerations: str = None
+) -> io.BytesIO:
+    """Generate the PDF in the worker pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _PDF_POOL,
+        functools.partial(
+            generate_pdf,
+            cv_analysis=cv_analysis,
+            job_offer_analysis=job_offer_analysis,
+            strengths=strengths,
+            weaknesses=weaknesses,
+            recommendation=recommendation,
+            match_percentage=match_percentage,
+            four_week_plan=four_week_plan,
+            additional_considerations=additional_considerations
+        )
+    )
@@ -0,0 +1,124 @@
+import functools
+import io
+import os
+
+import orjson
+from cachetools import TTLCache
+
+# Seconds a process status, and its generated PDF, stay retrievable
+STATUS_TTL_SECONDS = 3600
+PDF_TTL_SECONDS = 1800
+
+# Status hash fields holding task flags are prefixed so they can be told apart from the rest
+_TASK_PREFIX = "task:"
+
+
+class MemoryStatusStore:
+    """Process status and PDFs kept in this worker's memory
+
+    Only the worker that handled a process can answer for it, and
+    everything is lost on restart. Used when REDIS_URL is not set.
+    """
+
+    def __init__(self):
+        # Bounded and expiring so memory tracks recent processes, not lifetime traffic
+        self._statuses: TTLCache = TTLCache(maxsize=1024, ttl=STATUS_TTL_SECONDS)
+        self._pdfs: TTLCache = TTLCache(maxsize=64, ttl=PDF_TTL_SECONDS)
+
+    async def save_status(self, process_id: str, status: dict):
+        self._statuses[process_id] = status
+
+    async def mark_tasks(self, process_id: str, *tasks: str):
+        for task in tasks:
+            self._statuses[process_id]["tasks"][task] = True
+
+    async def update_status(self, process_id: str, **fields):
+        self._statuses[process_id].update(fields)
+
+    async def get_status(self, process_id: str) -> dict | None:
+        status = self._statuses.get(process_id)
+        return dict(status) if status is not None else None
+
+    async def save_pdf(self, process_id: str, pdf_buffer: io.BytesIO):
+        # Keep the buffer itself, not a copy of its bytes
+        self._pdfs[process_id] = pdf_buffer
+
+    async def get_pdf(self, process_id: str) -> memoryview | None:
+        pdf_buffer = self._pdfs.get(process_id)
+        return pdf_buffer.getbuffer() if pdf_buffer is not None else None
+
+    async def has_pdf(self, process_id: str) -> bool:
+        return process_id in self._pdfs
+
+    async def close(self):
+        pass
+
+
+class RedisStatusStore:
+    """Process status and PDFs kept in Redis, shared by every worker
+
+    Each status is a hash under proc:{process_id} with JSON-encoded
+    fields, one per task flag, so marking a task is a single HSET with
+    no read-modify-write. PDFs are raw bytes under pdf:{process_id}.
+    """
+
+    def __init__(self, redis_url: str):
+        # Imported here so the dependency is only needed when Redis is configured
+        from redis.asyncio import Redis
+
+        self._redis = Redis.from_url(redis_url)
+
+    async def _write_status(self, process_id: str, fields: dict):
+        """Set status hash fields and refresh the key's expiry in one round trip"""
+        key = f"proc:{process_id}"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping={name: orjson.dumps(value) for name, value in fields.items()})
+            pipe.expire(key, STATUS_TTL_SECONDS)
+            await pipe.execute()
+
+    async def save_status(self, process_id: str, status: dict):
+        fields = {name: value for name, value in status.items() if name != "tasks"}
+        for task, done in status["tasks"].items():
+            fields[_TASK_PREFIX + task] = done
+        await self._write_status(process_id, fields)
+
+    async def mark_tasks(self, process_id: str, *tasks: str):
+        await self._write_status(process_id, {_TASK_PREFIX + task: True for task in tasks})
+
+    async def update_status(self, process_id: str, **fields):
+        await self._write_status(process_id, fields)
+
+    async def get_status(self, process_id: str) -> dict | None:
+        raw = await self._redis.hgetall(f"proc:{process_id}")
+        if not raw:
+            return None
+
+        status = {"tasks": {}}
+        for name, value in raw.items():
+            name = name.decode()
+            if name.startswith(_TASK_PREFIX):
+                status["tasks"][name[len(_TASK_PREFIX):]] = orjson.loads(value)
+            else:
+                status[name] = orjson.loads(value)
+        return status
+
+    async def save_pdf(self, process_id: str, pdf_buffer: io.BytesIO):
+        await self._redis.set(f"pdf:{process_id}", pdf_buffer.getbuffer(), ex=PDF_TTL_SECONDS)
+
+    async def get_pdf(self, process_id: str) -> bytes | None:
+        return await self._redis.get(f"pdf:{process_id}")
+
+    async def has_pdf(self, process_id: str) -> bool:
+        return bool(await self._redis.exists(f"pdf:{process_id}"))
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+@functools.lru_cache(maxsize=1)
+def get_status_store() -> MemoryStatusStore | RedisStatusStore:
+    """Return the Redis-backed store if REDIS_URL is set, else the in-memory one"""
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        return RedisStatusStore(redis_url)
+    return MemoryStatusStore()
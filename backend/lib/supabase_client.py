@@ -1,12 +1,78 @@
+import functools
 import os
-from supabase import create_client, Client
 
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_ANON_KEY")
-supabase_service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+import httpx
+from postgrest import AsyncPostgrestClient, AsyncRequestBuilder
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+from supabase import Client, create_client
 
-if not supabase_url or not supabase_key:
-    raise ValueError("Supabase credentials not found in environment variables")
 
-supabase_client: Client = create_client(supabase_url, supabase_key)
-supabase_admin: Client = create_client(supabase_url, supabase_service_key) if supabase_service_key else supabase_client
+def _supabase_url() -> str:
+    """Return the project URL, checking credentials are configured"""
+    supabase_url = os.getenv("SUPABASE_URL")
+    if not supabase_url or not os.getenv("SUPABASE_ANON_KEY"):
+        raise ValueError("Supabase credentials not found in environment variables")
+    return supabase_url
+
+
+@functools.lru_cache(maxsize=1)
+def get_client() -> Client:
+    """Return the anon-key client, created on first use"""
+    return create_client(_supabase_url(), os.getenv("SUPABASE_ANON_KEY"))
+
+
+@functools.lru_cache(maxsize=1)
+def get_admin() -> Client:
+    """Return the service-role client (bypasses RLS), or the anon client without a service key"""
+    supabase_service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    if not supabase_service_key:
+        return get_client()
+    return create_client(_supabase_url(), supabase_service_key)
+
+
+class _PooledAsyncPostgrestClient(AsyncPostgrestClient):
+    """PostgREST client on an httpx.AsyncClient with a sized keep-alive pool and HTTP/2"""
+
+    def create_session(self, base_url, headers, timeout) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            http2=True,
+        )
+
+
+@functools.lru_cache(maxsize=1)
+def get_async_admin() -> AsyncPostgrestClient:
+    """Return an async PostgREST client with the same key as get_admin, created on first use
+
+    Queries are awaited on the event loop rather than run in worker threads,
+    and concurrent ones share pooled (multiplexed) connections.
+    """
+    supabase_url = _supabase_url()
+    supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_ANON_KEY")
+    return _PooledAsyncPostgrestClient(
+        f"{supabase_url}/rest/v1",
+        headers={
+            **DEFAULT_POSTGREST_CLIENT_HEADERS,
+            "apikey": supabase_key,
+            "Authorization": f"Bearer {supabase_key}",
+        },
+    )
+
+
+@functools.cache
+def admin_table(table_name: str) -> AsyncRequestBuilder:
+    """Return the async admin client's request builder for a table, created on first use
+
+    A builder only holds the shared session and the table path; every
+    select/insert/update/delete on it starts a new query, so it can be reused.
+    """
+    return get_async_admin().table(table_name)
+
+
+async def close_async_admin():
+    """Close the async admin client's connections, if it was ever created"""
+    if get_async_admin.cache_info().currsize:
+        await get_async_admin().aclose()
@@ -2,6 +2,7 @@
 Script to list available Gemini models for debugging
 """
 import os
+import sys
 
 import google.generativeai as genai
 from dotenv import load_dotenv
@@ -17,16 +18,17 @@ genai.configure(api_key=api_key)
 
 print("Listing available Gemini models:\n")
 try:
-    models = genai.list_models()
-    for model in models:
-        if 'generateContent' in model.supported_generation_methods:
-            model_name = model.name
-            # Extract short name
-            short_name = model_name.split('/')[-1] if '/' in model_name else model_name
-            print(f"✓ {short_name}")
-            print(f"  Full name: {model_name}")
-            print(f"  Methods: {model.supported_generation_methods}")
-            print()
+    models = [
+        model for model in genai.list_models()
+        if 'generateContent' in model.supported_generation_methods
+    ]
+    # Build the whole listing first and write it in one call
+    sys.stdout.write("".join(
+        f"✓ {model.name.rsplit('/', 1)[-1]}\n"
+        f"  Full name: {model.name}\n"
+        f"  Methods: {model.supported_generation_methods}\n\n"
+        for model in models
+    ))
 except Exception as e:
     print(f"Error listing models: {e}")
     print("\nTrying common model names directly:")
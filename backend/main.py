@@ -1,25 +1,45 @@
+import asyncio
+import functools
 import hashlib
 import io
 import logging
 import os
-from datetime import datetime, timedelta
+from collections.abc import Coroutine
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, File, Form, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
 
-from lib.document_processor import extract_text_from_input
+from lib.document_processor import close_http_client, extract_text_from_input
 from lib.gemini_client import analyze_cv, analyze_job_offer, compare_cv_and_offer
-from lib.pdf_generator import generate_pdf
-from lib.supabase_client import supabase_admin, supabase_client
+from lib.pdf_generator import generate_pdf_async
+from lib.status_store import get_status_store
+from lib.supabase_client import admin_table, close_async_admin
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Career Assistant API")
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Application startup and shutdown hooks"""
+    yield
+    # Let pending cache writes finish before their clients go away
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    # Release pooled connections of the shared link-fetching client, Supabase and the status store
+    await close_http_client()
+    await close_async_admin()
+    await status_store.close()
+
+
+app = FastAPI(title="Career Assistant API", lifespan=lifespan)
 
 # CORS configuration
 app.add_middleware(
@@ -34,14 +54,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Store processing status (in production, use Redis or similar)
-# Structure: {process_id: {status, tasks, results, pdf_buffer}}
-processing_status = {}
+# Processing status and generated PDFs by process_id
+# Status structure: {status, tasks, results}
+# Shared through Redis when REDIS_URL is set, so any worker can answer
+# status and download requests; otherwise kept in this worker's memory
+status_store = get_status_store()
+
+# Bytes per chunk when streaming a stored PDF to the client
+PDF_CHUNK_SIZE = 64 * 1024
+
+# Fire-and-forget tasks; the event loop only keeps weak references, so hold them until done
+background_tasks: set[asyncio.Task] = set()
 
 
-@app.get("/")
+# The root body never changes, so its response is serialized once at import
+ROOT_RESPONSE = ORJSONResponse({"message": "Career Assistant API"})
+
+
+@app.get("/", response_class=ORJSONResponse)
 async def root():
-    return {"message": "Career Assistant API"}
+    return ROOT_RESPONSE
 
 
 @app.get("/api/health")
@@ -59,38 +91,27 @@ async def health_check():
     return health_status
 
 
+# Texts are retained as keys, so the cache holds a bounded number of recent inputs
+@functools.lru_cache(maxsize=256)
 def generate_hash(text: str) -> str:
-    """Generate SHA256 hash of text content"""
-    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    """Generate a BLAKE2b-64 hash of text content (a cache key, not a security check)"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
 
 
-async def get_cached_comparison(
-    session_id: str,
-    cv_text_hash: str,
-    job_offer_text_hash: str,
-    additional_considerations_hash: str | None
-) -> dict | None:
-    """Check if comparison results exist in cache"""
+async def get_cached_session(session_id: str) -> dict | None:
+    """Fetch the comparison_cache row for a session_id, or None if there is none"""
     try:
         # Use admin client to bypass RLS
-        client = supabase_admin if supabase_admin else supabase_client
-        query = client.table("comparison_cache").select("*").eq("session_id", session_id)
-        result = query.execute()
+        query = admin_table("comparison_cache").select("*").eq("session_id", session_id)
+        result = await query.execute()
 
         if result.data and len(result.data) > 0:
-            cached = result.data[0]
-            # Verify hashes match
-            if (
-                cached["cv_text_hash"] == cv_text_hash and
-                cached["job_offer_text_hash"] == job_offer_text_hash and
-                cached.get("additional_considerations_hash") == additional_considerations_hash
-            ):
-                logger.info(f"Cache hit for session_id: {session_id}")
-                return cached["comparison_results"]
+            logger.info(f"Found cached results for session_id: {session_id}")
+            return result.data[0]
 
         return None
     except Exception as e:
-        logger.warning(f"Error checking cache: {str(e)}")
+        logger.warning(f"Error checking cache by session_id: {str(e)}")
         return None
 
 
@@ -101,16 +122,19 @@ async def save_comparison_to_cache(
     additional_considerations_hash: str | None,
     comparison_results: dict,
     cv_analysis: str | None = None,
-    job_offer_analysis: str | None = None
+    job_offer_analysis: str | None = None,
+    row_exists: bool = False
 ):
-    """Save comparison results to cache including analyses for PDF generation"""
+    """
+    Save comparison results to cache including analyses for PDF generation.
+    row_exists says whether the session already has a comparison_cache row
+    (known from get_cached_session): it is updated in place, otherwise a new
+    row is inserted. The row is not sent back, as nothing reads it.
+    """
     try:
         # Use admin client to bypass RLS
-        if not supabase_admin:
-            logger.warning("supabase_admin not available, cannot save to cache")
-            return
-
-        supabase_admin.table("comparison_cache").upsert({
+        table = admin_table("comparison_cache")
+        row = {
             "session_id": session_id,
             "cv_text_hash": cv_text_hash,
             "job_offer_text_hash": job_offer_text_hash,
@@ -118,23 +142,53 @@ async def save_comparison_to_cache(
             "comparison_results": comparison_results,
             "cv_analysis": cv_analysis,
             "job_offer_analysis": job_offer_analysis
-        }).execute()
+        }
+
+        if not row_exists:
+            try:
+                await table.insert(row, returning=ReturnMethod.minimal).execute()
+            except APIError as e:
+                # A concurrent request created the session's row first (unique violation)
+                if e.code != "23505":
+                    raise
+                row_exists = True
+
+        if row_exists:
+            await table.update(row, returning=ReturnMethod.minimal).eq("session_id", session_id).execute()
         logger.info(f"Comparison saved to cache for session_id: {session_id}")
     except Exception as e:
         logger.warning(f"Error saving to cache: {str(e)}")
         # Don't fail the request if cache save fails
 
 
-def log_task(task_name: str):
-    """Helper to log task start"""
-    logger.info('--------------------------------')
-    logger.info(f"Task: {task_name}")
-    logger.info('--------------------------------')
+def run_in_background(coro: Coroutine):
+    """Schedule a coroutine without awaiting it, keeping the task alive until it finishes"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
 
 
-def initialize_process_status(process_id: str):
+async def skipped() -> None:
+    """Stand-in for a lookup that does not apply, so asyncio.gather keeps its positions"""
+    return None
+
+
+async def extract_optional_text(
+    file: UploadFile | None,
+    link: str | None,
+    text: str | None = None
+) -> str | None:
+    """Return text given directly, else extract it from the file or link, else None"""
+    if text:
+        return text
+    if file or link:
+        return await extract_text_from_input(file, link)
+    return None
+
+
+async def initialize_process_status(process_id: str):
     """Initialize processing status tracking"""
-    processing_status[process_id] = {
+    await status_store.save_status(process_id, {
         "status": "processing",
         "tasks": {
             "understand_cv": False,
@@ -143,68 +197,49 @@ def initialize_process_status(process_id: str):
             "generate_pdf": False
         },
         "results": None
-    }
+    })
 
 
 async def analyze_documents(cv_text: str, job_offer_text: str, process_id: str):
     """Analyze CV and job offer documents"""
-    log_task("Understand CV")
-    processing_status[process_id]["tasks"]["understand_cv"] = True
-    cv_analysis = await analyze_cv(cv_text)
-
-    log_task("Understand Job Offer")
-    processing_status[process_id]["tasks"]["understand_offer"] = True
-    job_offer_analysis = await analyze_job_offer(job_offer_text)
+    logger.info("stage=%s process_id=%s", "understand_cv", process_id)
+    logger.info("stage=%s process_id=%s", "understand_offer", process_id)
+    await status_store.mark_tasks(process_id, "understand_cv", "understand_offer")
+
+    # Both analyses are independent Gemini calls, so run them concurrently
+    cv_analysis, job_offer_analysis = await asyncio.gather(
+        analyze_cv(cv_text),
+        analyze_job_offer(job_offer_text)
+    )
 
     return cv_analysis, job_offer_analysis
 
 
-async def get_cached_comparison_by_session_id(session_id: str) -> tuple[dict | None, str | None, str | None]:
-    """Get cached comparison results by session_id only (without hash verification)
-    Returns: (comparison_results, cv_analysis, job_offer_analysis)
-    """
-    try:
-        client = supabase_admin if supabase_admin else supabase_client
-        query = client.table("comparison_cache").select("*").eq("session_id", session_id)
-        result = query.execute()
-
-        if result.data and len(result.data) > 0:
-            cached = result.data[0]
-            logger.info(f"Found cached results for session_id: {session_id}")
-            return (
-                cached["comparison_results"],
-                cached.get("cv_analysis"),
-                cached.get("job_offer_analysis")
-            )
-
-        return None, None, None
-    except Exception as e:
-        logger.warning(f"Error checking cache by session_id: {str(e)}")
-        return None, None, None
-
-
 async def get_or_compute_comparison(
     cv_text: str | None,
     job_offer_text: str | None,
     additional_considerations: str | None,
     session_id: str | None,
-    process_id: str
+    process_id: str,
+    cached_session: dict | None = None
 ) -> tuple[dict, bool, str | None, str | None]:
     """
     Get comparison from cache or compute it.
+    cached_session is the comparison_cache row for session_id, already
+    fetched by the caller with get_cached_session.
     Returns: (comparison_results, from_cache, cv_analysis, job_offer_analysis)
     """
     # If only session_id is provided (no files), try to get from cache directly
     if session_id and not cv_text and not job_offer_text:
-        cached_results, cached_cv_analysis, cached_job_offer_analysis = (
-            await get_cached_comparison_by_session_id(session_id)
-        )
-        if cached_results:
+        if cached_session and cached_session["comparison_results"]:
             logger.info("Using cached comparison results from session_id only")
-            processing_status[process_id]["tasks"]["compare"] = True
-            processing_status[process_id]["tasks"]["understand_cv"] = True
-            processing_status[process_id]["tasks"]["understand_offer"] = True
-            return cached_results, True, cached_cv_analysis, cached_job_offer_analysis
+            await status_store.mark_tasks(process_id, "compare", "understand_cv", "understand_offer")
+            return (
+                cached_session["comparison_results"],
+                True,
+                cached_session.get("cv_analysis"),
+                cached_session.get("job_offer_analysis")
+            )
         else:
             logger.warning(f"Session ID '{session_id}' not found in cache")
             raise HTTPException(
@@ -230,24 +265,23 @@ async def get_or_compute_comparison(
         generate_hash(additional_considerations) if additional_considerations else None
     )
 
-    # Check cache if session_id is provided
-    if session_id:
-        cached_results = await get_cached_comparison(
-            session_id,
-            cv_text_hash,
-            job_offer_text_hash,
-            additional_considerations_hash
-        )
-        if cached_results:
-            logger.info("Using cached comparison results")
-            processing_status[process_id]["tasks"]["compare"] = True
-            # Return cached results, but we still need to analyze for PDF generation
-            # Even when using cache, we need cv_analysis and job_offer_analysis for PDF
-            return cached_results, True, None, None
+    # Reuse the cached comparison if the session was run on the same inputs
+    if (
+        cached_session and
+        cached_session["comparison_results"] and
+        cached_session["cv_text_hash"] == cv_text_hash and
+        cached_session["job_offer_text_hash"] == job_offer_text_hash and
+        cached_session.get("additional_considerations_hash") == additional_considerations_hash
+    ):
+        logger.info(f"Cache hit for session_id: {session_id}")
+        await status_store.mark_tasks(process_id, "compare")
+        # Return cached results, but we still need to analyze for PDF generation
+        # Even when using cache, we need cv_analysis and job_offer_analysis for PDF
+        return cached_session["comparison_results"], True, None, None
 
     # Compute comparison
-    log_task("Compare and generate results")
-    processing_status[process_id]["tasks"]["compare"] = True
+    logger.info("stage=%s process_id=%s", "compare", process_id)
+    await status_store.mark_tasks(process_id, "compare")
 
     cv_analysis, job_offer_analysis = await analyze_documents(
         cv_text, job_offer_text, process_id
@@ -259,17 +293,19 @@ async def get_or_compute_comparison(
         additional_considerations
     )
 
-    # Save to cache if session_id is provided
+    # Save to cache if session_id is provided, in the background: the save is
+    # best-effort, so the PDF and response need not wait for the write
     if session_id:
-        await save_comparison_to_cache(
+        run_in_background(save_comparison_to_cache(
             session_id,
             cv_text_hash,
             job_offer_text_hash,
             additional_considerations_hash,
             comparison_results,
             cv_analysis,
-            job_offer_analysis
-        )
+            job_offer_analysis,
+            row_exists=cached_session is not None
+        ))
 
     return comparison_results, False, cv_analysis, job_offer_analysis
 
@@ -290,10 +326,10 @@ async def generate_and_upload_pdf(
             cv_text, job_offer_text, process_id
         )
 
-    log_task("Generate PDF")
-    processing_status[process_id]["tasks"]["generate_pdf"] = True
+    logger.info("stage=%s process_id=%s", "generate_pdf", process_id)
+    await status_store.mark_tasks(process_id, "generate_pdf")
 
-    pdf_buffer = generate_pdf(
+    pdf_buffer = await generate_pdf_async(
         cv_analysis=cv_analysis,
         job_offer_analysis=job_offer_analysis,
         strengths=comparison_results["strengths"],
@@ -307,7 +343,7 @@ async def generate_and_upload_pdf(
     return pdf_buffer
 
 
-@app.post("/api/process")
+@app.post("/api/process", response_class=ORJSONResponse)
 async def process_application(
     cv_file: UploadFile | None = File(None),
     cv_link: str | None = Form(None),
@@ -323,30 +359,15 @@ async def process_application(
     logger.info("Starting process application")
     logger.info(f"User ID: {user_id}, Session ID: {session_id}")
 
-    process_id = f"process_{datetime.now().timestamp()}"
-    initialize_process_status(process_id)
+    # One timezone-aware timestamp for the whole request (process id, rate limits, logging)
+    now = datetime.now(timezone.utc)
+    process_id = f"process_{now.timestamp()}"
+    await initialize_process_status(process_id)
 
     try:
-        # Extract text from inputs (only if files/links are provided)
-        cv_text = None
-        job_offer_text_extracted = None
-
-        if cv_file or cv_link:
-            cv_text = await extract_text_from_input(cv_file, cv_link)
-
-        # Prioridad: texto directo > archivo > enlace
-        if job_offer_text:
-            job_offer_text_extracted = job_offer_text
-        elif job_offer_file or job_offer_link:
-            job_offer_text_extracted = await extract_text_from_input(job_offer_file, job_offer_link)
-
-        has_files = bool(cv_text or job_offer_text_extracted)
-
-        # Check if session_id exists in cache
-        session_exists_in_cache = False
-        if session_id:
-            cached_results, _, _ = await get_cached_comparison_by_session_id(session_id)
-            session_exists_in_cache = cached_results is not None
+        # Decide from the raw inputs, so sessions and rate limits are checked
+        # before paying for text extraction
+        has_files = bool(cv_file or cv_link or job_offer_file or job_offer_link or job_offer_text)
 
         # Determine if this is a new request:
         # - If files are provided → New request (processes files, regardless of cache)
@@ -354,6 +375,14 @@ async def process_application(
         # - If session_id exists in cache AND no files → Reusing existing session (not new request)
         is_new_request = has_files
 
+        # Look up the session once (the row is reused by get_or_compute_comparison)
+        # and count requests for the rate limits, both round trips at once
+        cached_session, request_counts = await asyncio.gather(
+            get_cached_session(session_id) if session_id else skipped(),
+            count_requests_combined(user_ip, now, hours=24) if is_new_request else skipped()
+        )
+        session_exists_in_cache = cached_session is not None
+
         # If trying to reuse a session that doesn't exist, return error
         if not has_files and session_id and not session_exists_in_cache:
             raise HTTPException(
@@ -367,7 +396,7 @@ async def process_application(
 
         # Check global rate limit FIRST (for all new requests)
         if is_new_request:
-            total_requests = await count_total_requests(hours=24)
+            total_requests, request_count = request_counts
             if total_requests >= 10:
                 logger.warning(f"Global rate limit exceeded: {total_requests} total requests in 24 hours")
                 raise HTTPException(
@@ -379,10 +408,8 @@ async def process_application(
                     }
                 )
 
-        # Check per-IP rate limit (only for new requests)
-        if is_new_request and user_ip:
-            request_count = await count_user_requests(user_ip, hours=24)
-            if request_count >= 2:
+            # Check per-IP rate limit (only for new requests)
+            if user_ip and request_count >= 2:
                 logger.warning(f"Rate limit exceeded for IP {user_ip}: {request_count} requests")
                 raise HTTPException(
                     status_code=429,
@@ -400,6 +427,13 @@ async def process_application(
                 detail="Either provide CV and job offer files/links, or provide a session_id"
             )
 
+        # Extract text from inputs (only if files/links are provided), both at once
+        # Prioridad: texto directo > archivo > enlace
+        cv_text, job_offer_text_extracted = await asyncio.gather(
+            extract_optional_text(cv_file, cv_link),
+            extract_optional_text(job_offer_file, job_offer_link, text=job_offer_text)
+        )
+
         # Get or compute comparison results
         comparison_results, from_cache, cv_analysis, job_offer_analysis = (
             await get_or_compute_comparison(
@@ -407,13 +441,14 @@ async def process_application(
                 job_offer_text_extracted,
                 additional_considerations,
                 session_id,
-                process_id
+                process_id,
+                cached_session
             )
         )
 
         # Generate PDF if we have analyses (from cache or newly computed)
         # PDF can be generated even without original files if we have cached analyses
-        pdf_buffer_data = None
+        pdf_buffer = None
         if cv_analysis and job_offer_analysis:
             # We can generate PDF with cached analyses even without original text files
             pdf_buffer = await generate_and_upload_pdf(
@@ -425,72 +460,83 @@ async def process_application(
                 cv_analysis,
                 job_offer_analysis
             )
-            pdf_buffer.seek(0)
-            pdf_buffer_data = pdf_buffer.read()
         else:
             logger.info("Skipping PDF generation - no analyses available")
-            processing_status[process_id]["tasks"]["generate_pdf"] = True
+            await status_store.mark_tasks(process_id, "generate_pdf")
 
-        # Store PDF buffer in memory for download
-        processing_status[process_id]["pdf_buffer"] = pdf_buffer_data
+        # Store PDF for download
+        if pdf_buffer is not None:
+            await status_store.save_pdf(process_id, pdf_buffer)
 
         # Store results
-        processing_status[process_id]["results"] = {
+        results = {
             **comparison_results,
             "process_id": process_id,
-            "pdf_available": pdf_buffer_data is not None
+            "pdf_available": pdf_buffer is not None
         }
-        processing_status[process_id]["status"] = "completed"
+        await status_store.update_status(process_id, results=results, status="completed")
 
         # Save user IP address ONLY if it's a new request (not reusing existing session)
         if is_new_request:
-            await save_user_request(process_id, user_id, user_ip)
+            await save_user_request(process_id, user_id, user_ip, now)
 
-        return {
+        return ORJSONResponse({
             "process_id": process_id,
             "status": "completed",
-            "results": processing_status[process_id]["results"]
-        }
+            "results": results
+        })
 
     except HTTPException:
         # Re-raise HTTPExceptions (like session_not_found) to preserve status code and detail
         raise
     except Exception as e:
-        processing_status[process_id]["status"] = "error"
-        processing_status[process_id]["error"] = str(e)
+        await status_store.update_status(process_id, status="error", error=str(e))
         logger.error(f"Error processing application: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/status/{process_id}")
+@app.get("/api/status/{process_id}", response_class=ORJSONResponse)
 async def get_status(process_id: str):
     """Get processing status"""
-    if process_id not in processing_status:
+    status_data = await status_store.get_status(process_id)
+    if status_data is None:
         raise HTTPException(status_code=404, detail="Process not found")
 
-    status_data = processing_status[process_id].copy()
-
-    # Remove pdf_buffer from response (it's too large and not needed in status)
+    # Report whether the PDF is available rather than its contents
     # PDF can be downloaded via /api/download endpoint
-    if "pdf_buffer" in status_data:
-        status_data["pdf_buffer"] = "available" if status_data["pdf_buffer"] else None
+    if status_data["status"] == "completed":
+        status_data["pdf_buffer"] = "available" if await status_store.has_pdf(process_id) else None
+
+    # Already JSON-safe, so skip jsonable_encoder and serialize with orjson
+    return ORJSONResponse(status_data)
+
+
+async def iter_pdf_chunks(pdf: bytes | memoryview):
+    """Yield a stored PDF in chunks from a view of its bytes
 
-    return status_data
+    Reading through a memoryview gives every download its own position, so
+    concurrent downloads of the same PDF don't share a buffer's cursor.
+    The generator is async so StreamingResponse iterates it on the event
+    loop instead of handing each chunk to the threadpool.
+    """
+    pdf_view = memoryview(pdf)
+    for start in range(0, len(pdf_view), PDF_CHUNK_SIZE):
+        yield bytes(pdf_view[start:start + PDF_CHUNK_SIZE])
 
 
 @app.get("/api/download/{process_id}")
 async def download_pdf(process_id: str):
     """Download generated PDF from memory"""
-    if process_id not in processing_status:
+    if await status_store.get_status(process_id) is None:
         raise HTTPException(status_code=404, detail="Process not found")
 
-    pdf_buffer_data = processing_status[process_id].get("pdf_buffer")
-    if not pdf_buffer_data:
+    pdf = await status_store.get_pdf(process_id)
+    if pdf is None:
         raise HTTPException(status_code=404, detail="PDF not found")
 
     try:
         return StreamingResponse(
-            io.BytesIO(pdf_buffer_data),
+            iter_pdf_chunks(pdf),
             media_type="application/pdf",
             headers={"Content-Disposition": f"attachment; filename=career_analysis_{process_id}.pdf"}
         )
@@ -504,24 +550,19 @@ async def download_pdf(process_id: str):
 
 
 
-async def count_total_requests(hours: int = 24) -> int:
+async def count_total_requests(now: datetime, hours: int = 24) -> int:
     """Count total completed requests in the last N hours (global limit)"""
     try:
-        # Use admin client to bypass RLS
-        if not supabase_admin:
-            logger.warning("supabase_admin not available, cannot count total requests")
-            return 0
-
         # Calculate the time threshold
-        threshold_time = (datetime.now() - timedelta(hours=hours)).isoformat()
+        threshold_time = (now - timedelta(hours=hours)).isoformat()
 
         # Count all requests in the last N hours
-        result = supabase_admin.table("user_requests").select(
-            "id"
-        ).gte("created_at", threshold_time).execute()
+        result = await admin_table("user_requests").select(
+            "id", count="exact"
+        ).gte("created_at", threshold_time).limit(1).execute()
 
-        # Count the number of results
-        count = len(result.data) if result.data else 0
+        # Postgres counts the rows; at most one row is sent back
+        count = result.count or 0
         logger.info(f"Total requests in the last {hours} hours: {count}")
         return count
     except Exception as e:
@@ -530,27 +571,22 @@ async def count_total_requests(hours: int = 24) -> int:
         return 0
 
 
-async def count_user_requests(user_ip: str, hours: int = 24) -> int:
+async def count_user_requests(user_ip: str, now: datetime, hours: int = 24) -> int:
     """Count completed requests from an IP address in the last N hours"""
     if not user_ip:
         return 0
 
     try:
-        # Use admin client to bypass RLS
-        if not supabase_admin:
-            logger.warning("supabase_admin not available, cannot count user requests")
-            return 0
-
         # Calculate the time threshold
-        threshold_time = (datetime.now() - timedelta(hours=hours)).isoformat()
+        threshold_time = (now - timedelta(hours=hours)).isoformat()
 
         # Count requests from this IP in the last N hours
-        result = supabase_admin.table("user_requests").select(
-            "id"
-        ).eq("ip_address", user_ip).gte("created_at", threshold_time).execute()
+        result = await admin_table("user_requests").select(
+            "id", count="exact"
+        ).eq("ip_address", user_ip).gte("created_at", threshold_time).limit(1).execute()
 
-        # Count the number of results
-        count = len(result.data) if result.data else 0
+        # Postgres counts the rows; at most one row is sent back
+        count = result.count or 0
         logger.info(f"IP {user_ip} has {count} requests in the last {hours} hours")
         return count
     except Exception as e:
@@ -559,23 +595,32 @@ async def count_user_requests(user_ip: str, hours: int = 24) -> int:
         return 0
 
 
-async def save_user_request(process_id: str, user_id: str, user_ip: str | None):
+async def count_requests_combined(
+    user_ip: str | None,
+    now: datetime,
+    hours: int = 24
+) -> tuple[int, int]:
+    """Count total and per-IP requests in the last N hours, running both queries concurrently"""
+    total_requests, user_requests = await asyncio.gather(
+        count_total_requests(now, hours=hours),
+        count_user_requests(user_ip, now, hours=hours)
+    )
+    return total_requests, user_requests
+
+
+async def save_user_request(process_id: str, user_id: str, user_ip: str | None, now: datetime):
     """Save user IP address and request timestamp to database (only if process completed)"""
     if not user_ip:
         return  # Skip if no IP provided
 
     try:
         # Use admin client to bypass RLS
-        if not supabase_admin:
-            logger.warning("supabase_admin not available, cannot save user request")
-            return
-
-        supabase_admin.table("user_requests").insert({
+        await admin_table("user_requests").insert({
             "ip_address": user_ip,
             "process_id": process_id,
             "user_id": user_id,
-            "created_at": datetime.now().isoformat()
-        }).execute()
+            "created_at": now.isoformat()
+        }, returning=ReturnMethod.minimal).execute()
         logger.info(f"User request saved: IP={user_ip}, process_id={process_id}")
     except Exception as e:
         logger.warning(f"Error saving user request: {str(e)}")
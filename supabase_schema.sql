@@ -64,3 +64,20 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+
+-- Schedule the cleanup functions inside the database with pg_cron
+-- (available on Supabase: Database > Extensions > pg_cron).
+-- cron.schedule() replaces an existing job with the same name, so this block can be re-run safely.
+CREATE EXTENSION IF NOT EXISTS pg_cron;
+
+SELECT cron.schedule(
+    'delete-old-comparison-cache',
+    '0 3 * * *',
+    $$SELECT delete_old_comparison_cache()$$
+);
+
+SELECT cron.schedule(
+    'delete-old-user-requests',
+    '30 3 * * *',
+    $$SELECT delete_old_user_requests()$$
+);